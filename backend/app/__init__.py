@@ -1,11 +1,13 @@
 # app/__init__.py
 from gradio_client import Client
 import os
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, app, jsonify, send_from_directory
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from .config import Config
+from .ast_cache import init_ast_cache
 
 # Initialize extensions
 db = SQLAlchemy()
@@ -44,6 +46,11 @@ def create_app(config_class=Config):
     db.init_app(app)
     login_manager.init_app(app)
     
+    # Background writer for non-critical submission records (see main.routes)
+    app.db_writer = ThreadPoolExecutor(max_workers=2)
+    
+    init_ast_cache(app.config['AST_CACHE_PATH'], app.config['AST_CACHE_MAX_BYTES'])
+    
     @login_manager.user_loader
     def load_user(user_id):
         return User.query.get(int(user_id))
@@ -0,0 +1,126 @@
+# app/ast_cache.py
+"""
+On-disk cache of parsed javalang trees shared by all worker processes.
+
+Entries are keyed by (source hash, javalang version) so a parser upgrade
+never serves stale trees. The hash comes from utils.cache_key and names its
+algorithm ('b3:...' / 's256:...'), so keys from BLAKE3 and SHA-256 deployments
+never collide. The cache is best-effort: any SQLite or pickle failure is
+reported and treated as a miss.
+
+The file is bounded: entries are stamped when written or read, and the least
+recently used ones are deleted once the blobs exceed max_bytes. Very large
+sources (and trees that pickle too large) are never stored.
+"""
+import pickle
+import sqlite3
+import threading
+import time
+from importlib.metadata import version, PackageNotFoundError
+
+try:
+    JAVALANG_VERSION = version('javalang')
+except PackageNotFoundError:
+    JAVALANG_VERSION = 'unknown'
+
+MAX_SOURCE_LENGTH = 256 * 1024  # Longer sources are parsed but not cached on disk
+MAX_BLOB_BYTES = 4 * 1024 * 1024  # Pickled trees above this are skipped
+_PRUNE_EVERY = 32  # Writes between size checks
+_TOUCH_AFTER = 60  # Seconds before a read refreshes an entry's access time
+
+_db_path = None  # Disabled until init_ast_cache() is called
+_max_bytes = 0
+_writes = 0  # Writes since the last prune (per process, approximate)
+_local = threading.local()  # sqlite3 connections must stay on their own thread
+
+
+def init_ast_cache(path, max_bytes=256 * 1024 * 1024):
+    """Enable the cache, creating the SQLite file and table if needed."""
+    global _db_path, _max_bytes
+    _db_path = path
+    _max_bytes = max_bytes
+    try:
+        _prune(_connection())
+    except sqlite3.Error as e:
+        print(f"❌ AST cache disabled ({path}): {e}")
+        _db_path = None
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != _db_path:
+        conn = sqlite3.connect(_db_path, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(ast_cache)')}
+        if columns and 'accessed' not in columns:
+            # Cache file from before entries were bounded; it is only a cache
+            conn.execute('DROP TABLE ast_cache')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS ast_cache '
+            '(hash TEXT PRIMARY KEY, jl_ver TEXT, blob BLOB, size INTEGER, accessed REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ast_cache_accessed ON ast_cache (accessed)')
+        _local.conn = conn
+        _local.path = _db_path
+    return conn
+
+
+def _prune(conn):
+    """Delete least recently used entries until the blobs fit in _max_bytes."""
+    conn.execute(
+        'DELETE FROM ast_cache WHERE hash IN ('
+        ' SELECT hash FROM (SELECT hash, SUM(size) OVER (ORDER BY accessed DESC, hash) AS total FROM ast_cache)'
+        ' WHERE total > ?)',
+        (_max_bytes,)
+    )
+
+
+def get(code_hash):
+    """Return the cached value for code_hash, or None on a miss."""
+    if _db_path is None:
+        return None
+    try:
+        conn = _connection()
+        row = conn.execute(
+            'SELECT blob, accessed FROM ast_cache WHERE hash = ? AND jl_ver = ?',
+            (code_hash, JAVALANG_VERSION)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > _TOUCH_AFTER:
+            # Hits keep an entry from being pruned; refreshed at most once a minute
+            conn.execute('UPDATE ast_cache SET accessed = ? WHERE hash = ?', (now, code_hash))
+        return pickle.loads(row[0])
+    except Exception as e:
+        print(f"AST cache read failed: {e}")
+        return None
+
+
+def put(code_hash, value):
+    """Store value for code_hash, replacing any previous entry."""
+    global _writes
+    if _db_path is None:
+        return
+    try:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > MAX_BLOB_BYTES:
+            return
+        conn = _connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO ast_cache (hash, jl_ver, blob, size, accessed) VALUES (?, ?, ?, ?, ?)',
+                (code_hash, JAVALANG_VERSION, sqlite3.Binary(blob), len(blob), time.time())
+            )
+            _writes += 1
+            if _writes >= _PRUNE_EVERY:
+                _writes = 0
+                _prune(conn)
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+    except Exception as e:
+        # Very deep trees can exceed the pickle recursion limit; just skip them
+        print(f"AST cache write failed: {e}")
@@ -18,6 +18,10 @@ class Config:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(base_dir, '..', 'users.db')
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Persistent cache of parsed Java ASTs (SQLite, shared across workers)
+    AST_CACHE_PATH = os.environ.get('AST_CACHE_PATH') or os.path.join(base_dir, '..', 'ast_cache.db')
+    AST_CACHE_MAX_BYTES = int(os.environ.get('AST_CACHE_MAX_BYTES') or 256 * 1024 * 1024)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
     
     # Security settings
@@ -1,12 +1,16 @@
 # app/main/routes.py
 from asyncio.log import logger
 import hashlib
+import functools
+import gzip
+import threading
 import uuid
 import os
 import networkx as nx
 from graphviz import Digraph
 from werkzeug import Response
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import OrderedDict
 import multiprocessing
 from ..cfg_utils import CFGGenerator 
 from app.cfg_utils import CFGGenerator
@@ -18,10 +22,66 @@ from ..models import CodeSubmission, User # from app/models.py
 from .. import db # from app/__init__.py
 from ..utils import ( # from app/utils.py
     preprocess_code, format_ast, clean_comment, detect_relationships,
-    extract_methods, extract_classes, compute_hash, build_ast_json, wrap_code_if_needed
+    extract_methods, extract_classes, compute_hash, cache_key, build_ast_json_text, parse_cached
 )
 
 
+@functools.lru_cache(maxsize=256)
+def _format_ast_cached(code):
+    # Users often resubmit the same (possibly broken) code; format it once
+    return format_ast(code)
+
+
+@functools.lru_cache(maxsize=256)
+def _detect_relationships_cached(code):
+    return detect_relationships(code)
+
+
+def _persist_submissions(app, payloads):
+    """Insert CodeSubmission rows off the request thread with a single commit (runs on app.db_writer)."""
+    with app.app_context():
+        try:
+            db.session.bulk_save_objects([CodeSubmission(**payload) for payload in payloads])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            names = ', '.join(payload.get('submission_name', '?') for payload in payloads)
+            app.logger.error(f"Failed to persist submission(s) {names}: {e}")
+        finally:
+            db.session.remove()
+
+
+# Rendered CFGs keyed by (cache_key(code), theme) -> (svg_bytes, gzipped_svg_bytes),
+# least recently used first
+_cfg_cache: OrderedDict[tuple[str, str], tuple[bytes, bytes]] = OrderedDict()
+_CFG_CACHE_MAX = 64  # Renders kept; the oldest is evicted beyond this
+_cfg_cache_lock = threading.Lock()
+
+
+def _render_cfg(code, theme):
+    """Render the CFG SVG for code/theme, reusing a previous render when possible."""
+    key = (cache_key(code), theme)
+    with _cfg_cache_lock:
+        rendered = _cfg_cache.get(key)
+        if rendered is not None:
+            _cfg_cache.move_to_end(key)
+            return rendered
+
+    # Create CFG generator
+    generator = CFGGenerator()
+    generator.generate(code)
+    
+    # Generate SVG content with theme support; compress once, serve many times
+    svg_bytes = generator.visualize(format="svg", theme=theme).encode('utf-8')
+    rendered = (svg_bytes, gzip.compress(svg_bytes, compresslevel=6))
+
+    with _cfg_cache_lock:
+        _cfg_cache[key] = rendered
+        if len(_cfg_cache) > _CFG_CACHE_MAX:
+            _cfg_cache.popitem(last=False)
+    return rendered
+
+
 @main_bp.route('/generate-cfg', methods=['POST'])
 @login_required
 def generate_cfg():
@@ -29,19 +89,14 @@ def generate_cfg():
     theme = request.json.get('theme', 'light')  # Get theme from request
     
     try:
-        # Create CFG generator
-        generator = CFGGenerator()
-        cfg = generator.generate(code)
-        
-        # Generate SVG content with theme support
-        svg_content = generator.visualize(format="svg", theme=theme)
+        svg_bytes, svg_gzip = _render_cfg(code, theme)
+        headers = {'Content-Disposition': 'inline; filename=cfg.svg', 'Vary': 'Accept-Encoding'}
         
-        # Return SVG directly
-        return Response(
-            svg_content,
-            mimetype='image/svg+xml',
-            headers={'Content-Disposition': 'inline; filename=cfg.svg'}
-        )
+        # SVG is highly compressible; send the precompressed body when the client accepts it
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            return Response(svg_gzip, mimetype='image/svg+xml', headers=headers)
+        return Response(svg_bytes, mimetype='image/svg+xml', headers=headers)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -59,10 +114,9 @@ def home():
     if request.method == 'POST':
         try:
             code_input = request.json.get('code', '')
-            submission_name_provided = request.json.get('submission_name', '') or ''
-            submission_name_provided = submission_name_provided.strip() if submission_name_provided else ''
+            submission_name_provided = (request.json.get('submission_name') or '').strip()
             
-            if not code_input.strip() or code_input == '{{ code_input }}': #
+            if not code_input.strip(): #
                 return jsonify({ #
                     'comments': '<div class="comment-error">Error: No Code Submitted</div>',
                     'ast': '<div class="ast-error">Error: No Code Submitted</div>'
@@ -79,31 +133,30 @@ def home():
             if existing_submission: #
                 ast_output = existing_submission.ast_content #
                 comments_output = existing_submission.comments_content #
-                relationships = detect_relationships(code_input) #
+                relationships = _detect_relationships_cached(code_input) #
             else:
                 # Wrap code in class if needed (handled in utils functions)
                 # Try parsing to catch any remaining errors
                 try:
-                    wrapped_code, was_wrapped = wrap_code_if_needed(code_input)
-                    javalang.parse.parse(wrapped_code)
+                    parse_cached(code_input)
                 except javalang.parser.JavaSyntaxError as e: #
                     line_number = getattr(e.at, 'line', 'unknown') #
                     return jsonify({ #
                         'comments': f'<div class="comment-error">Java Syntax Error (Line {line_number}): {e.description}</div>',
-                        'ast': format_ast(code_input) # Still show AST if possible
+                        'ast': _format_ast_cached(code_input) # Still show AST if possible
                     })
 
                 class_structure = extract_classes(code_input) #
                 method_structure = extract_methods(code_input) #
 
                 if isinstance(class_structure, dict) and 'error' in class_structure: #
-                     return jsonify({'comments': class_structure['error'], 'ast': format_ast(code_input)})
+                     return jsonify({'comments': class_structure['error'], 'ast': _format_ast_cached(code_input)})
                 if isinstance(method_structure, dict) and 'error' in method_structure: #
-                     return jsonify({'comments': method_structure['error'], 'ast': format_ast(code_input)})
+                     return jsonify({'comments': method_structure['error'], 'ast': _format_ast_cached(code_input)})
 
 
-                ast_output = format_ast(code_input) #
-                relationships = detect_relationships(code_input) #
+                ast_output = _format_ast_cached(code_input) #
+                relationships = _detect_relationships_cached(code_input) #
                 grouped_comments = {} #
 
                 # Batch processing for faster comment generation
@@ -123,23 +176,32 @@ def home():
                     all_inputs = []
                     input_mapping = []  # Track which input corresponds to which class/method
                     
+                    back_map = []  # input_mapping index -> index into all_inputs
+                    seen = {}  # Identical snippets (e.g. repeated getters) are sent only once
+                    
                     # Add classes
                     for class_name, class_code in class_structure.items():
                         processed_class = preprocess_code(class_code)
-                        all_inputs.append(processed_class)
+                        if processed_class not in seen:
+                            seen[processed_class] = len(all_inputs)
+                            all_inputs.append(processed_class)
+                        back_map.append(seen[processed_class])
                         input_mapping.append(('class', class_name, None))
                     
                     # Add methods
                     for class_name, methods in method_structure.items():
                         for method in methods:
                             processed_method = preprocess_code(method['code'])
-                            all_inputs.append(processed_method)
+                            if processed_method not in seen:
+                                seen[processed_method] = len(all_inputs)
+                                all_inputs.append(processed_method)
+                            back_map.append(seen[processed_method])
                             input_mapping.append(('method', class_name, method['name']))
                     
                     # Process in batches (model can handle multiple inputs at once)
                     if all_inputs:
                         try:
-                            # Process all inputs using hf_client
+                            # Process all unique inputs using hf_client
                             batch_results = []
                             if hf_client:
                                 for snippet in all_inputs:
@@ -155,8 +217,8 @@ def home():
                             
                             # Map results back to classes/methods
                             for idx, (input_type, class_name, method_name) in enumerate(input_mapping):
-                                if idx < len(batch_results):
-                                    result = batch_results[idx]
+                                if back_map[idx] < len(batch_results):
+                                    result = batch_results[back_map[idx]]
                                     comment = clean_comment(result)  # result is already a string
                                     
                                     if input_type == 'class':
@@ -215,7 +277,7 @@ def home():
                 comments_output = '\n'.join(comments_output_list) if comments_output_list else "No comments generated" #
 
                 # Generate default name if not provided
-                if submission_name_provided and submission_name_provided != '':
+                if submission_name_provided:
                     final_submission_name = submission_name_provided
                 else:
                     # Try to extract class name from code
@@ -229,7 +291,8 @@ def home():
                         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
                         final_submission_name = f"Submission-{timestamp}"
                 
-                new_submission = CodeSubmission(
+                # Response does not depend on the row id, so commit in the background
+                current_app.db_writer.submit(_persist_submissions, current_app._get_current_object(), [dict(
                     user_id=current_user.id,
                     code_content=code_input,
                     submission_name=final_submission_name,
@@ -237,9 +300,7 @@ def home():
                     comments_content=comments_output,
                     code_hash=code_hash,
                     is_success=True
-                )
-                db.session.add(new_submission) #
-                db.session.commit() #
+                )])
 
             return jsonify({ #
                 'comments': comments_output,
@@ -252,13 +313,10 @@ def home():
             current_app.logger.error(f"Server error in home POST: {str(e)}")
             # Attempt to get code_input and submission_name from request
             code_input_for_error = request.json.get('code', '') if request.is_json else "Unavailable"
-            error_submission_name = ''
-            if request.is_json:
-                error_submission_name = request.json.get('submission_name', '') or ''
-                error_submission_name = error_submission_name.strip() if error_submission_name else ''
+            error_submission_name = (request.json.get('submission_name') or '').strip() if request.is_json else ''
             
             # Generate error name
-            if error_submission_name and error_submission_name != '':
+            if error_submission_name:
                 error_name = f"Failed-{error_submission_name}"
             else:
                 # Try to extract class name from code
@@ -276,14 +334,12 @@ def home():
                     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
                     error_name = f"Failed-{timestamp}"
             
-            error_submission = CodeSubmission(
+            current_app.db_writer.submit(_persist_submissions, current_app._get_current_object(), [dict(
                 user_id=current_user.id,
                 code_content=code_input_for_error,
                 submission_name=error_name,
                 is_success=False
-            )
-            db.session.add(error_submission) #
-            db.session.commit() #
+            )])
 
             return jsonify({ #
                 'comments': f"Error: {str(e)}",
@@ -384,12 +440,17 @@ def get_submission(submission_id): #
 @main_bp.route('/rename-submission/<int:submission_id>', methods=['POST']) #
 @login_required #
 def rename_submission(submission_id): #
-    submission = CodeSubmission.query.filter_by( #
+    # Ownership check only needs the id; avoid loading the large TEXT columns
+    CodeSubmission.query.with_entities(CodeSubmission.id).filter_by( #
         id=submission_id, #
         user_id=current_user.id #
     ).first_or_404()
     new_name = request.json.get('new_name', 'Unnamed Submission') #
-    submission.submission_name = new_name #
+    db.session.execute(
+        db.update(CodeSubmission)
+        .where(CodeSubmission.id == submission_id)
+        .values(submission_name=new_name)
+    )
     db.session.commit() #
     return jsonify({'status': 'success'}) #
 
@@ -398,11 +459,13 @@ def rename_submission(submission_id): #
 @login_required #
 def delete_submission(submission_id): #
     try:
-        submission = CodeSubmission.query.filter_by( #
+        CodeSubmission.query.with_entities(CodeSubmission.id).filter_by( #
             id=submission_id, #
             user_id=current_user.id #
         ).first_or_404()
-        db.session.delete(submission) #
+        db.session.execute(
+            db.delete(CodeSubmission).where(CodeSubmission.id == submission_id)
+        )
         db.session.commit() #
         current_app.logger.debug(f"Successfully deleted submission {submission_id} for user {current_user.username}") #
         return jsonify({'status': 'success'}) #
@@ -417,10 +480,10 @@ def delete_submission(submission_id): #
 @main_bp.route('/ast-json', methods=['POST'])
 def ast_json():
     code = request.json.get('code', '')
-    ast_data = build_ast_json(code)
-    relationships = detect_relationships(code)
-    ast_data['relationships'] = relationships
-    return jsonify(ast_data)
+    relationships = _detect_relationships_cached(code)
+    # Serialised while the tree is walked instead of building dicts for jsonify
+    ast_text = build_ast_json_text(code, relationships=relationships)
+    return Response(ast_text, mimetype='application/json')
 
 @main_bp.route('/process-folder', methods=['POST'])
 @login_required
@@ -432,56 +495,53 @@ def process_folder():
         if not uploaded_files:
             return jsonify({"error": "No files uploaded"}), 400
         
-        # Process each file
+        # Get pipeline reference before threading (to avoid context issues)
+        hf_client = current_app.hf_client
+
+        def read_file(file):
+            """Read and decode one upload (runs on the reader pool)"""
+            return file.read().decode('utf-8')
+
         results = {}
-        for file in uploaded_files:
-            if file.filename.endswith('.java'):
-                code_content = file.read().decode('utf-8')
-                filename = file.filename
-                
-                # Process the code (similar to your home route)
+        parsed_files = {}  # filename -> (code_content, ast_output, grouped_comments)
+        all_inputs = []  # Unique preprocessed snippets across every file
+        input_mapping = []  # (filename, input_type, class_name, method_name)
+        back_map = []  # input_mapping index -> index into all_inputs
+        seen = {}
+
+        def add_input(snippet, mapping):
+            if snippet not in seen:
+                seen[snippet] = len(all_inputs)
+                all_inputs.append(snippet)
+            back_map.append(seen[snippet])
+            input_mapping.append(mapping)
+
+        # Stage 1 (read) runs in the background while stage 2 (parse) walks the
+        # files in upload order, so results, comment inputs and saved rows keep
+        # that order from one request to the next
+        with ThreadPoolExecutor(max_workers=4) as reader:
+            read_futures = {
+                reader.submit(read_file, file): file.filename
+                for file in uploaded_files
+                if file.filename.endswith('.java')
+            }
+            for future, filename in read_futures.items():
                 try:
-                    # Your existing processing logic here
-                    ast_output = format_ast(code_content)
+                    code_content = future.result()
+
+                    # Files that don't parse are reported, not commented on or saved
+                    try:
+                        parse_cached(code_content)
+                    except javalang.parser.JavaSyntaxError as e:
+                        line_number = getattr(e.at, 'line', None) or getattr(getattr(e.at, 'position', None), 'line', 'unknown')
+                        results[filename] = {'error': f'Java Syntax Error (Line {line_number}): {e.description}'}
+                        continue
                     
                     # Extract classes and methods
                     class_structure = extract_classes(code_content)
                     method_structure = extract_methods(code_content)
-                    
-                    # Get pipeline reference before threading (to avoid context issues)
-                    hf_client = current_app.hf_client
-                    
-                    # Generate comments using parallel processing (reuse helper functions)
-                    def generate_class_comment_folder(class_name, class_code):
-                        """Generate comment for a single class (folder processing)"""
-                        try:
-                            processed_class = preprocess_code(class_code)
-                            if hf_client:
-                                result = hf_client.predict(
-                                    processed_class,
-                                    api_name="/generate_comment"
-                                )
-                                comment = clean_comment(result)  # result is a string
-                        except Exception as e:
-                            print(f"Error generating comment for class {class_name}: {e}")
-                            return class_name, None
-                        return class_name, None
 
-                    def generate_method_comment_folder(class_name, method):
-                        """Generate comment for a single method (folder processing)"""
-                        try:
-                            processed_method = preprocess_code(method['code'])
-                            if hf_client:
-                                result = hf_client.predict(
-                                    processed_method,
-                                    api_name="/generate_comment"
-                                )
-                                comment = clean_comment(result)  # result is a string
-                                return (class_name, method['name']), f'<div class="comment-method" id="method_{class_name}_{method["name"]}">◆ {class_name}.{method["name"]}:\n{comment}</div>'
-                        except Exception as e:
-                            print(f"Error generating comment for method {class_name}.{method['name']}: {e}")
-                            return (class_name, method['name']), None
-                        return (class_name, method['name']), None
+                    ast_output = format_ast(code_content)
 
                     # Initialize grouped_comments structure
                     grouped_comments = {}
@@ -491,57 +551,95 @@ def process_folder():
                         if class_name not in grouped_comments:
                             grouped_comments[class_name] = {'class_comment': '', 'method_comments': []}
 
-                    # Process classes and methods in parallel
-                    max_workers = min(8, len(class_structure) + sum(len(methods) for methods in method_structure.values()))
-                    if max_workers > 0 and hf_client:
-                        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                            # Submit all class comment generation tasks
-                            class_futures = {
-                                executor.submit(generate_class_comment_folder, class_name, class_code): class_name
-                                for class_name, class_code in class_structure.items()
-                            }
-                            
-                            # Submit all method comment generation tasks
-                            method_futures = {
-                                executor.submit(generate_method_comment_folder, class_name, method): (class_name, method['name'])
-                                for class_name, methods in method_structure.items()
-                                for method in methods
-                            }
-                            
-                            # Collect class comments as they complete
-                            for future in as_completed(class_futures):
-                                class_name, comment_html = future.result()
-                                if comment_html:
-                                    grouped_comments[class_name]['class_comment'] = comment_html
-                            
-                            # Collect method comments as they complete
-                            for future in as_completed(method_futures):
-                                (class_name, method_name), comment_html = future.result()
-                                if comment_html:
-                                    grouped_comments[class_name]['method_comments'].append(comment_html)
-                    
-                    comments_output_list = []
-                    for class_data in grouped_comments.values():
-                        if class_data['class_comment']: 
-                            comments_output_list.append(class_data['class_comment'])
-                        comments_output_list.extend(class_data['method_comments'])
-                    comments_output = '\n'.join(comments_output_list) if comments_output_list else "No comments generated"
-                    
-                    # Store results for this file
-                    results[filename] = {
-                        'ast': ast_output,
-                        'comments': comments_output,
-                        'code': code_content
-                    }
-                    
+                    for class_name, class_code in class_structure.items():
+                        if isinstance(class_code, str):
+                            add_input(preprocess_code(class_code), (filename, 'class', class_name, None))
+                    for class_name, methods in method_structure.items():
+                        if isinstance(methods, list):
+                            for method in methods:
+                                add_input(preprocess_code(method['code']), (filename, 'method', class_name, method['name']))
+
+                    parsed_files[filename] = (code_content, ast_output, grouped_comments)
                 except Exception as e:
                     results[filename] = {
                         'error': str(e)
                     }
+
+        # Stage 3: one pass over the inputs of every file
+        def generate_comment_folder(snippet):
+            """Generate comment for a single class/method body (folder processing)"""
+            try:
+                result = hf_client.predict(
+                    snippet,
+                    api_name="/generate_comment"
+                )
+                return clean_comment(result)  # result is a string
+            except Exception as e:
+                print(f"❌ HF API error for snippet: {e}")
+                return "No comment available"
+
+        if all_inputs and hf_client:
+            with ThreadPoolExecutor(max_workers=min(8, len(all_inputs))) as executor:
+                batch_results = list(executor.map(generate_comment_folder, all_inputs))
+
+            for idx, (filename, input_type, class_name, method_name) in enumerate(input_mapping):
+                comment = batch_results[back_map[idx]]
+                grouped_comments = parsed_files[filename][2]
+                if input_type == 'class':
+                    grouped_comments[class_name]['class_comment'] = \
+                        f'<div class="comment-class" id="class_{class_name}">📦 Class: {class_name}\n{comment}</div>'
+                else:  # method
+                    grouped_comments[class_name]['method_comments'].append(
+                        f'<div class="comment-method" id="method_{class_name}_{method_name}">◆ {class_name}.{method_name}:\n{comment}</div>'
+                    )
+
+        # Like home(), a source the user already has a successful submission for
+        # isn't stored again (nor twice from the same upload)
+        file_hashes = {filename: compute_hash(entry[0]) for filename, entry in parsed_files.items()}
+        stored_hashes = set()
+        if file_hashes:
+            stored = CodeSubmission.query.filter_by(
+                user_id=current_user.id,
+                is_success=True
+            ).filter(CodeSubmission.code_hash.in_(set(file_hashes.values())))
+            stored_hashes = {code_hash for (code_hash,) in stored.with_entities(CodeSubmission.code_hash)}
+
+        submissions = []
+        for filename, (code_content, ast_output, grouped_comments) in parsed_files.items():
+            comments_output_list = []
+            for class_data in grouped_comments.values():
+                if class_data['class_comment']: 
+                    comments_output_list.append(class_data['class_comment'])
+                comments_output_list.extend(class_data['method_comments'])
+            comments_output = '\n'.join(comments_output_list) if comments_output_list else "No comments generated"
+            
+            # Store results for this file
+            results[filename] = {
+                'ast': ast_output,
+                'comments': comments_output,
+                'code': code_content
+            }
+            code_hash = file_hashes[filename]
+            if code_hash in stored_hashes:
+                continue
+            stored_hashes.add(code_hash)
+            submissions.append(dict(
+                user_id=current_user.id,
+                code_content=code_content,
+                submission_name=os.path.splitext(os.path.basename(filename))[0],
+                ast_content=ast_output,
+                comments_content=comments_output,
+                code_hash=code_hash,
+                is_success=True
+            ))
+
+        # One bulk insert + commit for the whole folder instead of one per file
+        if submissions:
+            current_app.db_writer.submit(_persist_submissions, current_app._get_current_object(), submissions)
         
         return jsonify(results)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
-# Model route removed - handled by React Router
\ No newline at end of file
+# Model route removed - handled by React Router
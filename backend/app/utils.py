@@ -1,226 +1,470 @@
 # app/utils.py
-import javalang
+import javalang  # type: ignore[import-untyped]
 import hashlib
+import json
+import re
+import sys
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Any, Callable
 from flask import current_app 
+from . import ast_cache
+
+# SIMD hashing for cache keys; hashlib's SHA-256 is used when blake3 isn't installed.
+# Keys carry the algorithm as a prefix so stored keys from the other one never match.
+_cache_hasher: Callable[[bytes], Any]
+try:
+    from blake3 import blake3
+    _cache_hasher = blake3
+    _CACHE_KEY_PREFIX = 'b3:'
+except ImportError:
+    _cache_hasher = hashlib.sha256
+    _CACHE_KEY_PREFIX = 's256:'
+
+# Any run of whitespace (or a lone tab/line break) becomes a single space
+_WS_RE = re.compile(r'[ \t\n\r]{2,}|[\t\n\r]')
+
 
 def preprocess_code(code: str) -> str:
     # ... (your preprocess_code function)
-    return (
-        code.replace('\t', ' ')
-        .replace('\n', ' ')
-        .replace('\r', ' ')
-        .replace('  ', ' ')
-        .strip()
-    )
+    return _WS_RE.sub(' ', code).strip()
 
 
-def wrap_code_if_needed(java_code: str) -> tuple[str, bool]:
+# Code that already opens with a (top-level) class declaration
+_CLASS_START_RE = re.compile(r'(?:public |private |protected |abstract |final )?class ')
+
+
+def _parse_tokens(code: str) -> tuple:
     """
-    Wrap Java code in a class if it doesn't have one.
-    Returns: (wrapped_code, was_wrapped)
+    Parse like javalang.parse.parse, but keep the token list so callers that
+    also need tokens (see _index_braces) don't run the tokenizer a second time.
+    Returns (tree, tokens).
     """
-    stripped = java_code.strip()
-    
-    # Check if code already starts with a class declaration
-    if (stripped.startswith('class ') or 
-        stripped.startswith('public class ') or 
-        stripped.startswith('private class ') or 
-        stripped.startswith('protected class ') or
-        stripped.startswith('abstract class ') or
-        stripped.startswith('final class ')):
-        return java_code, False
-    
+    tokens = list(javalang.tokenizer.tokenize(code))
+    return javalang.parser.Parser(tokens).parse(), tokens
+
+
+def _wrap_and_parse(java_code: str) -> tuple:
+    """wrap_code_if_needed plus the tokens of the parsed code: (wrapped_code, was_wrapped, tree, tokens)."""
+    # Code that starts with a class declaration is parsed as-is
+    if _CLASS_START_RE.match(java_code.strip()):
+        tree, tokens = _parse_tokens(java_code)
+        return java_code, False, tree, tokens
+
     # Try parsing as-is first
     try:
-        javalang.parse.parse(java_code)
-        return java_code, False
+        tree, tokens = _parse_tokens(java_code)
+        return java_code, False, tree, tokens
     except javalang.parser.JavaSyntaxError as e:
-        # Check if error is "expected type declaration" at line 1
-        error_line = 1
-        if e.at:
-            if isinstance(e.at, javalang.tokenizer.Position):
-                error_line = e.at.line
-            elif hasattr(e.at, 'position') and e.at.position:
-                error_line = e.at.position.line
-        
-        error_desc = e.description.lower() if e.description else ""
-        is_type_declaration_error = (
-            "expected type declaration" in error_desc or
-            ("expected" in error_desc and "declaration" in error_desc)
-        )
-        
-        # If error is at line 1 and is about type declaration, wrap in class
-        if error_line == 1 and is_type_declaration_error:
-            try:
-                wrapped_code = f"public class nan {{\n{java_code}\n}}"
-                # Verify the wrapped code parses correctly
-                javalang.parse.parse(wrapped_code)
-                return wrapped_code, True
-            except:
-                pass
-        
-        # For other errors, still try wrapping if it doesn't start with class
+        # Bare methods/fields/statements: retry inside a dummy class
+        wrapped_code = f"public class nan {{\n{java_code}\n}}"
         try:
-            wrapped_code = f"public class nan {{\n{java_code}\n}}"
-            javalang.parse.parse(wrapped_code)
-            return wrapped_code, True
-        except:
-            pass
-        
-        # If wrapping doesn't help, return original and let caller handle the error
-        return java_code, False
+            tree, tokens = _parse_tokens(wrapped_code)
+        except Exception:
+            # Wrapping doesn't help, so report the error in the code as written
+            raise e from None
+        return wrapped_code, True, tree, tokens
 
 
-def format_ast(java_code: str) -> str: #
-    # ... (your format_ast function)
-    # Make sure to handle imports like javalang at the top of this file
-    try:
-        # Wrap code in class if needed
-        wrapped_code, was_wrapped = wrap_code_if_needed(java_code)
-        tree = javalang.parse.parse(wrapped_code)
-        
-        # First pass: collect all classes and their inheritance relationships
-        class_nodes_map = {}
-        inheritance_map = {}  # Maps parent class name -> list of child class names
-        child_to_parent = {}  # Maps child class name -> parent class name
-        root_classes = []  # Classes that don't extend anything (or extend external classes)
-        
-        for _, class_node in tree.filter(javalang.tree.ClassDeclaration):
-            class_name = class_node.name
-            class_nodes_map[class_name] = class_node
-            
-            # Check if class extends another class
-            if hasattr(class_node, 'extends') and class_node.extends:
-                # Get the superclass name
-                parent_name = None
-                if hasattr(class_node.extends, 'name'):
-                    parent_name = class_node.extends.name
-                elif isinstance(class_node.extends, list) and len(class_node.extends) > 0:
-                    # Sometimes extends is a list
-                    parent_name = class_node.extends[0].name if hasattr(class_node.extends[0], 'name') else str(class_node.extends[0])
-                else:
-                    parent_name = str(class_node.extends)
-                
-                # Check if parent class exists in our code
+def wrap_code_if_needed(java_code: str) -> tuple:
+    """
+    Wrap Java code in a class if it doesn't have one.
+    Returns: (wrapped_code, was_wrapped, tree) where tree is the parse of wrapped_code.
+    Raises javalang.parser.JavaSyntaxError for the original code if it doesn't
+    parse either way.
+    """
+    wrapped_code, was_wrapped, tree, _ = _wrap_and_parse(java_code)
+    return wrapped_code, was_wrapped, tree
+
+
+# Parsed sources keyed by cache_key(java_code) -> entry dict (see parse_cached).
+# javalang trees are never mutated after parsing, so entries are shared between threads.
+_AST_CACHE_SIZE = 128
+_ast_cache: OrderedDict[str, dict] = OrderedDict()
+_ast_cache_lock = threading.Lock()
+
+
+def _first_type_name(types):
+    # Sometimes extends is a list
+    first = types[0]
+    first_name = getattr(first, 'name', None)
+    return first_name if first_name is not None else str(first)
+
+
+# Name resolvers keyed by the exact type of the reference; the javalang type
+# nodes always carry a name, so they skip the generic probing below
+_TYPE_NAME_RESOLVERS: dict[type, Callable[[Any], Any]] = {
+    javalang.tree.ReferenceType: attrgetter('name'),
+    javalang.tree.BasicType: attrgetter('name'),
+    list: _first_type_name,
+}
+
+
+def _extract_type_name(t):
+    """
+    Name of a javalang type reference (class extends, field, parameter or
+    return type). A list resolves to its first entry; anything without a
+    name falls back to str(). Returns None for a missing type.
+    """
+    if not t:
+        return None
+    resolver = _TYPE_NAME_RESOLVERS.get(type(t))
+    if resolver is not None:
+        return resolver(t)
+    name = getattr(t, 'name', None)
+    if name is not None:
+        return name
+    if isinstance(t, list):
+        return _first_type_name(t)
+    return str(t)
+
+
+def _index_classes(tree) -> dict:
+    """
+    Collect every class declaration and the inheritance structure in one walk.
+    A class only counts as a child when its parent was declared before it;
+    otherwise (or when the parent is external) it is a root.
+    """
+    class_nodes = []  # Every ClassDeclaration in source order (names may repeat)
+    class_nodes_map = {}
+    inheritance_map: defaultdict[str, list[str]] = defaultdict(list)  # Maps parent class name -> list of child class names
+    child_to_parent = {}  # Maps child class name -> parent class name
+    extends_info_map = {}  # Maps class name -> " extends Parent" suffix for display ("" if none)
+    root_classes = []  # Classes that don't extend anything (or extend external classes)
+
+    # Pre-order walk, same order as tree.filter() but without building paths
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, javalang.ast.Node):
+            if isinstance(node, javalang.tree.ClassDeclaration):
+                # Names are interned so the many dict lookups keyed by them
+                # (classes, comments, views) hit the identity fast path
+                class_name = sys.intern(node.name)
+                class_nodes.append(node)
+                class_nodes_map[class_name] = node
+
+                # Check if class extends another class in our code
+                parent_name = _extract_type_name(node.extends)
+                if parent_name:
+                    parent_name = sys.intern(parent_name)
+                extends_info_map[class_name] = f" extends {parent_name}" if parent_name else ""
                 if parent_name and parent_name in class_nodes_map:
                     # Parent is in our code, add to inheritance map
-                    if parent_name not in inheritance_map:
-                        inheritance_map[parent_name] = []
                     inheritance_map[parent_name].append(class_name)
                     child_to_parent[class_name] = parent_name
                 else:
-                    # Parent is external, treat as root class
+                    # No extends, or the parent is external: this is a root class
                     root_classes.append(class_name)
-            else:
-                # No extends, this is a root class
-                root_classes.append(class_name)
+            children = node.children
+        else:
+            children = node
+        stack.extend(
+            child for child in reversed(children)
+            if isinstance(child, (javalang.ast.Node, list, tuple))
+        )
+
+    return {
+        'class_nodes': class_nodes,
+        'classes': class_nodes_map,
+        # Plain dict so lookups of childless classes never insert empty lists
+        'inheritance': dict(inheritance_map),
+        'child_to_parent': child_to_parent,
+        'extends_info': extends_info_map,
+        'roots': root_classes,
+    }
+
+
+def parse_cached(java_code: str) -> dict:
+    """
+    Wrap (if needed) and parse Java code, reusing the result for repeated sources.
+    Returns the shared cache entry: a dict with 'wrapped_code', 'was_wrapped',
+    'tree' and the class index from _index_classes ('class_nodes', 'classes',
+    'inheritance', 'child_to_parent', 'extends_info', 'roots'). Callers must not
+    change these.
+    The entry is extended lazily with data derived from them ('braces', 'lines',
+    'views', 'tree_ops'; see the helpers that read those keys). Those writes
+    happen outside _ast_cache_lock: each key is only ever set to a value computed
+    from the same source, so racing threads at worst compute it twice and store
+    equal results, and a single dict assignment is atomic.
+    Raises javalang.parser.JavaSyntaxError like javalang.parse.parse.
+    """
+    key = cache_key(java_code)
+    with _ast_cache_lock:
+        entry = _ast_cache.get(key)
+        if entry is not None:
+            _ast_cache.move_to_end(key)
+            return entry
+
+    # Fall back to the on-disk cache shared by all workers before parsing.
+    # Very large sources stay out of it: their pickled trees are huge.
+    tokens = None
+    on_disk = len(java_code) <= ast_cache.MAX_SOURCE_LENGTH
+    parsed = ast_cache.get(key) if on_disk else None
+    if parsed is None:
+        wrapped_code, was_wrapped, tree, tokens = _wrap_and_parse(java_code)
+        parsed = (wrapped_code, was_wrapped, tree)
+        if on_disk:
+            ast_cache.put(key, parsed)
+
+    wrapped_code, was_wrapped, tree = parsed
+    entry = {'wrapped_code': wrapped_code, 'was_wrapped': was_wrapped, 'tree': tree}
+    entry.update(_index_classes(tree))
+    if tokens is not None:
+        # Fresh parse: index braces from the same tokens instead of re-tokenizing later
+        entry['braces'] = _index_braces(tokens)
+
+    with _ast_cache_lock:
+        _ast_cache[key] = entry
+        if len(_ast_cache) > _AST_CACHE_SIZE:
+            _ast_cache.popitem(last=False)
+    return entry
+
+
+def _parse(java_code: str) -> tuple[dict | None, Any]:
+    """
+    parse_cached for callers that render syntax errors instead of raising:
+    (parsed, None) on success, (None, the JavaSyntaxError) otherwise.
+    """
+    try:
+        return parse_cached(java_code), None
+    except javalang.parser.JavaSyntaxError as e:
+        return None, e
+
+
+# Flat per-class projection of the javalang nodes that format_ast and
+# build_ast_json render. Field lists hold one entry per declarator
+# ("int a, b;" gives two), method lists one entry per method, all in source order.
+@dataclass(slots=True, frozen=True)
+class _ClassView:
+    field_mods: list[str]
+    field_types: list[str]
+    field_names: list[str]
+    method_mods: list[str]
+    method_returns: list[str]
+    method_names: list[str]
+    method_params: list[str]
+    method_sigs: list[str]
+    method_bodies: list[Any]
+
+
+# Joined modifier strings ("public static", ...). The combinations form a small
+# set, so every field/method shares one interned string per combination.
+_MOD_CACHE: dict[tuple, str] = {}
+
+
+def _mods(modifiers) -> str:
+    key = tuple(modifiers) if modifiers else ()
+    joined = _MOD_CACHE.get(key)
+    if joined is None:
+        joined = _MOD_CACHE[key] = sys.intern(" ".join(key))
+    return joined
+
+
+def _build_class_view(class_node) -> _ClassView:
+    field_mods, field_types, field_names = [], [], []
+    for field in class_node.fields:
+        modifiers = _mods(field.modifiers)
+        field_type = _extract_type_name(field.type) or "Unknown"
+        for declarator in field.declarators:
+            field_mods.append(modifiers)
+            field_types.append(field_type)
+            field_names.append(declarator.name)
+
+    method_mods, method_returns, method_names, method_params, method_sigs, method_bodies = [], [], [], [], [], []
+    for method in class_node.methods:
+        modifiers = _mods(method.modifiers)
+        return_type = _extract_type_name(method.return_type) or "void"
+        params = ", ".join([f"{_extract_type_name(p.type)} {p.name}" for p in method.parameters]) if method.parameters else ""
+        method_mods.append(modifiers)
+        method_returns.append(return_type)
+        method_names.append(sys.intern(method.name))
+        method_params.append(params)
+        method_sigs.append(f"{modifiers} {return_type} {method.name}({params})")
+        method_bodies.append(method.body)
+
+    return _ClassView(
+        field_mods, field_types, field_names,
+        method_mods, method_returns, method_names, method_params,
+        method_sigs, method_bodies,
+    )
+
+
+# Views of recently seen classes keyed by a hash of their source text, so a
+# re-parse after an edit only rebuilds the views of the classes that changed
+_CLASS_VIEW_CACHE_SIZE = 512
+_class_view_cache: OrderedDict[str, _ClassView] = OrderedDict()
+_class_view_cache_lock = threading.Lock()
+
+
+def _class_source_key(parsed: dict, class_node, lines: list[str]) -> str | None:
+    """
+    Cache key for the source of class_node, from its 'class' keyword to the
+    line of its closing brace. None when the range can't be located.
+    """
+    position = class_node.position
+    block = _block_lines(parsed, position) if position else None
+    if block is None:
+        return None
+    first_line = lines[position.line - 1][position.column - 1:]
+    return cache_key('\n'.join([first_line, *lines[position.line:block[1]]]))
+
+
+def _class_views(parsed: dict) -> dict:
+    """Class name -> _ClassView for every indexed class. Computed once per cached parse."""
+    views = parsed.get('views')
+    if views is None:
+        lines = parsed['wrapped_code'].splitlines()
+        views = {}
+        for class_name, class_node in parsed['classes'].items():
+            key = _class_source_key(parsed, class_node, lines)
+            view: _ClassView | None = None
+            if key is not None:
+                with _class_view_cache_lock:
+                    view = _class_view_cache.get(key)
+                    if view is not None:
+                        _class_view_cache.move_to_end(key)
+            if view is None:
+                view = _build_class_view(class_node)
+                if key is not None:
+                    with _class_view_cache_lock:
+                        _class_view_cache[key] = view
+                        if len(_class_view_cache) > _CLASS_VIEW_CACHE_SIZE:
+                            _class_view_cache.popitem(last=False)
+            views[class_name] = view
+        parsed['views'] = views
+    return views
+
+
+# HTML fragments for format_ast; %-formatting a constant template is cheaper
+# than assembling each row from a multi-part f-string
+_AST_INDENT = "    "
+_AST_METHOD_PREFIX = "    │   "  # Method row under a non-final method
+_AST_LAST_METHOD_PREFIX = "        "
+_AST_CLOSE = '</div>'
+_AST_CLASS_TPL = '<div class="ast-class" data-class="%s" onclick="showClassComments(\'%s\')">%s%s📦 Class: %s%s</div>'
+_AST_FIELDS_OPEN = '<div class="ast-section">%s├─ 🟣 Fields:'
+_AST_FIELD_TPL = '<div class="ast-field">%s│   ├─ %s %s %s</div>'
+_AST_METHODS_OPEN = '<div class="ast-section">%s└─ 🔧 Methods:'
+_AST_METHOD_TPL = (
+    '<div class="ast-method" data-class="%s" data-method="%s" '
+    'onclick="showMethodComments(\'%s\', \'%s\')">%s %s 🔹 %s %s %s(%s)</div>'
+)
+_AST_VARS_OPEN = '<div class="ast-subsection">%s │ └─ 🟡 Variables:'
+_AST_VAR_TPL = '<div class="ast-var">%s │     ├─ %s</div>'
+_AST_LOOPS_OPEN = '<div class="ast-subsection">%s └─ 🔁 Loops:'
+_AST_LOOP_TPL = '<div class="ast-loop">%s       ├─ %s Loop'
+_AST_LOOP_VAR_TPL = '<div class="ast-loop-var">%s       │   ├─ 🟠 %s</div>'
+_AST_LOOP_EMPTY_TPL = '<div class="ast-loop-empty">%s       │   └─ (no variables)</div>'
+_AST_SUBCLASSES_OPEN = '<div class="ast-subsection">%s└─ 🔗 Subclasses:'
+
+
+def format_ast(java_code: str) -> str: #
+    # ... (your format_ast function)
+    # Make sure to handle imports like javalang at the top of this file
+    # Wrap code in class if needed; classes and inheritance are indexed once per source
+    parsed, error = _parse(java_code)
+    if parsed is None:
+        line_number: str | int = 'unknown'
+        if error.at:
+            if isinstance(error.at, javalang.tokenizer.Position):
+                line_number = error.at.line
+            elif hasattr(error.at, 'position'):
+                line_number = error.at.position.line
+        return f'<div class="ast-error">Java Syntax Error (Line {line_number}): {error.description}</div>'
+
+    class_nodes_map = parsed['classes']
+    inheritance_map = parsed['inheritance']
+    root_classes = parsed['roots']
+    class_views = _class_views(parsed)
+    extends_info_map = parsed['extends_info']
+    
+    output = ['<div class="ast-tree">']
+    append = output.append
+    # A real inheritance chain is never deeper than the number of classes;
+    # anything deeper is a cycle through duplicate class names
+    max_depth = len(class_nodes_map)
+    
+    # Pre-order walk from the root classes (those without parents in our code).
+    # A (None, _) entry closes the Subclasses section opened by the class
+    # rendered just before its children.
+    stack: list[tuple[str | None, int]] = [(root_class, 0) for root_class in reversed(root_classes)]
+    while stack:
+        class_name, indent_level = stack.pop()
+        if class_name is None:
+            append(_AST_CLOSE)
+            continue
+        if class_name not in class_nodes_map or indent_level > max_depth:
+            continue
         
-        output = ['<div class="ast-tree">']
+        view = class_views[class_name]
+        indent = _AST_INDENT * indent_level
+        prefix = "└─ " if indent_level > 0 else ""
         
-        # Helper function to render a class and its children recursively
-        def render_class_recursive(class_name, indent_level=0):
-            if class_name not in class_nodes_map:
-                return
-            
-            class_node = class_nodes_map[class_name]
-            indent = "    " * indent_level
-            prefix = "└─ " if indent_level > 0 else ""
-            
-            # Show inheritance info
-            extends_info = ""
-            if hasattr(class_node, 'extends') and class_node.extends:
-                if hasattr(class_node.extends, 'name'):
-                    parent_name = class_node.extends.name
-                elif isinstance(class_node.extends, list) and len(class_node.extends) > 0:
-                    parent_name = class_node.extends[0].name if hasattr(class_node.extends[0], 'name') else str(class_node.extends[0])
-                else:
-                    parent_name = str(class_node.extends)
-                extends_info = f" extends {parent_name}"
-            
-            output.append(
-                f'<div class="ast-class" data-class="{class_name}" '
-                f'onclick="showClassComments(\'{class_name}\')">'
-                f'{indent}{prefix}📦 Class: {class_name}{extends_info}'
-                '</div>'
-            )
-            
-            # Render fields
-            if class_node.fields:
-                field_indent = indent + ("    " if indent_level > 0 else "")
-                output.append(f'<div class="ast-section">{field_indent}├─ 🟣 Fields:')
-                for field in class_node.fields:
-                    modifiers = " ".join(field.modifiers) if field.modifiers else ""
-                    field_type = field.type.name if field.type else "Unknown"
-                    for declarator in field.declarators:
-                        output.append(
-                            f'<div class="ast-field">{field_indent}│   ├─ {modifiers} {field_type} {declarator.name}</div>'
-                        )
-                output.append('</div>')
-            
-            # Render methods
-            if class_node.methods:
-                method_indent = indent + ("    " if indent_level > 0 else "")
-                output.append(f'<div class="ast-section">{method_indent}└─ 🔧 Methods:')
-                for i, method in enumerate(class_node.methods):
-                    is_last_method = i == len(class_node.methods) - 1
-                    method_prefix = "    " if is_last_method else "│   "
-
-                    modifiers = " ".join(method.modifiers) if method.modifiers else ""
-                    return_type = method.return_type.name if method.return_type else "void"
-                    params = ", ".join([f"{p.type.name} {p.name}" for p in method.parameters]) if method.parameters else ""
-
-                    output.append(
-                        f'<div class="ast-method" data-class="{class_name}" data-method="{method.name}" '
-                        f'onclick="showMethodComments(\'{class_name}\', \'{method.name}\')">'
-                        f'{method_indent}    {method_prefix} {"└─" if is_last_method else "├─"} 🔹 {modifiers} {return_type} {method.name}({params})'
-                        '</div>'
-                    )
-
-                    method_vars, loops = _process_method_body(method.body)
-
-                    if method_vars:
-                        output.append(f'<div class="ast-subsection">{method_indent}    {method_prefix} │ └─ 🟡 Variables:')
-                        for var in method_vars:
-                            output.append(f'<div class="ast-var">{method_indent}    {method_prefix} │     ├─ {var}</div>')
-                        output.append('</div>')
-
-                    if loops:
-                        output.append(f'<div class="ast-subsection">{method_indent}    {method_prefix} └─ 🔁 Loops:')
-                        for loop in loops:
-                            output.append(f'<div class="ast-loop">{method_indent}    {method_prefix}       ├─ {loop["type"]} Loop')
-                            if loop['vars']:
-                                for var in loop['vars']:
-                                    output.append(f'<div class="ast-loop-var">{method_indent}    {method_prefix}       │   ├─ 🟠 {var}</div>')
-                            else:
-                                output.append(f'<div class="ast-loop-empty">{method_indent}    {method_prefix}       │   └─ (no variables)</div>')
-                        output.append('</div>')
-
-                output.append('</div>')
-            
-            # Render child classes (subclasses)
-            if class_name in inheritance_map:
-                child_indent = indent + ("    " if indent_level > 0 else "")
-                output.append(f'<div class="ast-subsection">{child_indent}└─ 🔗 Subclasses:')
-                for child_class in inheritance_map[class_name]:
-                    render_class_recursive(child_class, indent_level + 1)
-                output.append('</div>')
+        # Show inheritance info
+        append(_AST_CLASS_TPL % (class_name, class_name, indent, prefix, class_name, extends_info_map[class_name]))
+        
+        # Fields, methods and subclasses all sit one level below the class line
+        section_indent = indent + _AST_INDENT if indent_level > 0 else indent
+        
+        # Render fields
+        if view.field_names:
+            append(_AST_FIELDS_OPEN % section_indent)
+            for modifiers, field_type, field_name in zip(view.field_mods, view.field_types, view.field_names):
+                append(_AST_FIELD_TPL % (section_indent, modifiers, field_type, field_name))
+            append(_AST_CLOSE)
         
-        # Render all root classes (those without parents in our code)
-        for root_class in root_classes:
-            render_class_recursive(root_class, 0)
+        # Render methods
+        if view.method_names:
+            append(_AST_METHODS_OPEN % section_indent)
+            last_index = len(view.method_names) - 1
+            for i, (modifiers, return_type, method_name, params, body) in enumerate(zip(
+                view.method_mods, view.method_returns, view.method_names,
+                view.method_params, view.method_bodies
+            )):
+                is_last_method = i == last_index
+                row_indent = section_indent + (_AST_LAST_METHOD_PREFIX if is_last_method else _AST_METHOD_PREFIX)
 
-        output.append('</div>')
-        return '\n'.join(output)
+                append(_AST_METHOD_TPL % (
+                    class_name, method_name, class_name, method_name,
+                    row_indent, "└─" if is_last_method else "├─",
+                    modifiers, return_type, method_name, params
+                ))
 
-    except javalang.parser.JavaSyntaxError as e:
-        line_number = 'unknown'
-        if e.at:
-            if isinstance(e.at, javalang.tokenizer.Position):
-                line_number = e.at.line
-            elif hasattr(e.at, 'position'):
-                line_number = e.at.position.line
-        return f'<div class="ast-error">Java Syntax Error (Line {line_number}): {e.description}</div>'
+                method_vars, loops = _process_method_body(body)
+
+                if method_vars:
+                    append(_AST_VARS_OPEN % row_indent)
+                    for var in method_vars:
+                        append(_AST_VAR_TPL % (row_indent, var))
+                    append(_AST_CLOSE)
+
+                if loops:
+                    append(_AST_LOOPS_OPEN % row_indent)
+                    for loop in loops:
+                        append(_AST_LOOP_TPL % (row_indent, loop["type"]))
+                        if loop['vars']:
+                            for var in loop['vars']:
+                                append(_AST_LOOP_VAR_TPL % (row_indent, var))
+                        else:
+                            append(_AST_LOOP_EMPTY_TPL % row_indent)
+                    append(_AST_CLOSE)
+
+            append(_AST_CLOSE)
+        
+        # Render child classes (subclasses) after this class, but only when at
+        # least one of them gets rendered
+        if class_name in inheritance_map and indent_level < max_depth:
+            append(_AST_SUBCLASSES_OPEN % section_indent)
+            stack.append((None, indent_level))
+            stack.extend((child_class, indent_level + 1) for child_class in reversed(inheritance_map[class_name]))
+
+    output.append('</div>')
+    return '\n'.join(output)
 
 
 def _process_method_body(body): #
@@ -269,59 +513,84 @@ def _process_method_body(body): #
 
 
 def clean_comment(raw_comment: str) -> str: #
-    sentences = [s.strip() for s in raw_comment.split('.') if s.strip()]
-    filtered = []
+    filtered = [s[0].upper() + s[1:] for s in map(str.strip, raw_comment.split('.')) if s]
+    return '. '.join(filtered) + '.' if filtered else "No comment generated"
 
-    for sentence in sentences:
-        filtered.append(sentence[0].upper() + sentence[1:])
 
-    return '. '.join(filtered) + '.' if filtered else "No comment generated"
+def _index_braces(tokens) -> tuple:
+    """
+    Positions of every '{' token (sorted) and the line of its matching '}'.
+    Built from javalang tokens, so braces inside string literals and comments
+    are ignored.
+    """
+    open_positions: list[Any] = []
+    close_lines: list[int | None] = []
+    pending: list[int] = []  # Indexes into open_positions still waiting for their '}'
+    for token in tokens:
+        if not isinstance(token, javalang.tokenizer.Separator):
+            continue
+        if token.value == '{':
+            pending.append(len(open_positions))
+            open_positions.append(token.position)
+            close_lines.append(None)
+        elif token.value == '}' and pending:
+            close_lines[pending.pop()] = token.position.line
+    return open_positions, close_lines
+
+
+def _brace_index(parsed: dict) -> tuple:
+    """Brace index of the wrapped source (see _index_braces). Computed once per cached parse."""
+    index = parsed.get('braces')
+    if index is None:
+        index = parsed['braces'] = _index_braces(javalang.tokenizer.tokenize(parsed['wrapped_code']))
+    return index
+
+
+def _block_lines(parsed: dict, position) -> tuple[int, int] | None:
+    """
+    Find the first '{' at or after position and its matching '}'.
+    Returns 1-based (open_line, close_line) in wrapped-code lines, or None.
+    """
+    open_positions, close_lines = _brace_index(parsed)
+    i = bisect_left(open_positions, (position.line, position.column))
+    if i == len(open_positions) or close_lines[i] is None:
+        return None
+    return open_positions[i].line, close_lines[i]
+
+
+def _source_lines(parsed: dict, java_code: str) -> list[str]:
+    """java_code.splitlines() for the source parsed was cached under. Computed once per cached parse."""
+    lines = parsed.get('lines')
+    if lines is None:
+        lines = parsed['lines'] = java_code.splitlines()
+    return lines
 
 
 def extract_methods(java_code: str) -> dict: #
     # Remember to return jsonify errors or raise custom exceptions to be handled by routes
     try:
         # Wrap code in class if needed
-        wrapped_code, was_wrapped = wrap_code_if_needed(java_code)
-        tree = javalang.parse.parse(wrapped_code)
-        lines = java_code.splitlines()
-        method_map = {}
+        parsed = parse_cached(java_code)
+        lines = _source_lines(parsed, java_code)
+        method_map: dict[str, list[dict]] = {}
         
         # Adjust line offset if code was wrapped (wrapped code adds 1 line at the start)
-        line_offset = 1 if was_wrapped else 0
+        line_offset = 1 if parsed['was_wrapped'] else 0
 
-        for _, class_node in tree.filter(javalang.tree.ClassDeclaration):
-            class_name = class_node.name
+        for class_node in parsed['class_nodes']:
+            class_name = sys.intern(class_node.name)
             method_map[class_name] = []
 
             for method in class_node.methods:
-                if method.body is None:
+                if method.body is None or not method.position:
                     continue
 
-                # Adjust line number if code was wrapped
-                start_line = (method.position.line - 1 - line_offset) if method.position else 0
-                start_line = max(0, start_line)  # Ensure non-negative
-
-                brace_count = 0
-                method_lines = []
-                in_method_body = False
-
-                for i in range(start_line, len(lines)):
-                    line = lines[i]
-
-                    if '{' in line and not in_method_body:
-                        in_method_body = True
-                        brace_count += line.count('{')
-                        method_lines.append(line)
-                        continue
-
-                    if in_method_body:
-                        method_lines.append(line)
-                        brace_count += line.count('{')
-                        brace_count -= line.count('}')
-
-                        if brace_count == 0:
-                            break
+                # Whole lines from the body's opening brace to its matching close
+                block = _block_lines(parsed, method.position)
+                if block is None:
+                    continue
+                open_line, close_line = block
+                method_lines = lines[max(0, open_line - 1 - line_offset):close_line - line_offset]
 
                 method_code = '\n'.join(method_lines).strip()
 
@@ -329,7 +598,7 @@ def extract_methods(java_code: str) -> dict: #
                     continue
 
                 method_map[class_name].append({
-                    'name': method.name,
+                    'name': sys.intern(method.name),
                     'code': method_code
                 })
         return method_map
@@ -337,7 +606,7 @@ def extract_methods(java_code: str) -> dict: #
         # Consider raising an error instead of returning jsonify here,
         # so the route can handle the HTTP response.
         # For now, returning a dict that the route can jsonify.
-        line_number = 'unknown'
+        line_number: str | int = 'unknown'
         if e.at:
             if isinstance(e.at, javalang.tokenizer.Position): line_number = e.at.line
             elif hasattr(e.at, 'position'): line_number = e.at.position.line
@@ -348,47 +617,29 @@ def extract_classes(java_code: str) -> dict: #
     # ... (your extract_classes function)
     try:
         # Wrap code in class if needed
-        wrapped_code, was_wrapped = wrap_code_if_needed(java_code)
-        tree = javalang.parse.parse(wrapped_code)
-        lines = java_code.splitlines()
+        parsed = parse_cached(java_code)
+        lines = _source_lines(parsed, java_code)
         class_map = {}
         
         # Adjust line offset if code was wrapped (wrapped code adds 1 line at the start)
-        line_offset = 1 if was_wrapped else 0
+        line_offset = 1 if parsed['was_wrapped'] else 0
 
-        for _, class_node in tree.filter(javalang.tree.ClassDeclaration):
-            class_name = class_node.name
+        for class_node in parsed['class_nodes']:
+            class_name = sys.intern(class_node.name)
             # Adjust line number if code was wrapped
             start_line = (class_node.position.line - 1 - line_offset) if class_node.position else 0
             start_line = max(0, start_line)  # Ensure non-negative
 
-            brace_count = 0
-            class_lines = []
-            in_class = False
-
-            for i in range(start_line, len(lines)):
-                line = lines[i]
-                class_lines.append(line.strip())
-
-                brace_count += line.count('{')
-                brace_count -= line.count('}')
-
-                if not in_class and '{' in line:
-                    in_class = True
-                    # Reset brace_count when first open brace of class is found.
-                    # This assumes classes are not nested in a way that confuses this simple counter.
-                    brace_count = line.count('{') - line.count('}')
-                elif in_class and brace_count <= 0: # <= 0 to handle case where open and close are on same line
-                    # If we started with a brace, we need to find its match.
-                    # If the first line had more '{' than '}', this logic might need adjustment.
-                    # A more robust way is to count from the class declaration line's first '{'.
-                    break
+            # From the declaration line to the line holding the body's closing brace
+            block = _block_lines(parsed, class_node.position) if class_node.position else None
+            end_line = block[1] - line_offset if block else len(lines)
+            class_lines = [line.strip() for line in lines[start_line:end_line]]
 
             class_code = ' '.join(class_lines).strip()
             class_map[class_name] = class_code
         return class_map
     except javalang.parser.JavaSyntaxError as e:
-        line_number = 'unknown'
+        line_number: str | int = 'unknown'
         if e.at:
             if isinstance(e.at, javalang.tokenizer.Position): line_number = e.at.line
             elif hasattr(e.at, 'position'): line_number = e.at.position.line
@@ -399,6 +650,38 @@ def compute_hash(code): #
     return hashlib.sha256(code.encode('utf-8')).hexdigest()
 
 
+def cache_key(code: str) -> str:
+    """
+    Content key for the parse/render caches, including the on-disk AST cache
+    (app/ast_cache.py), which keeps its rows across restarts. It uses the faster
+    BLAKE3 when available and is prefixed with the algorithm ('b3:' or 's256:'),
+    so a deployment that switches hashers misses cleanly instead of mixing keys.
+    compute_hash stays plain SHA-256 because it is stored with each submission.
+    """
+    return _CACHE_KEY_PREFIX + _cache_hasher(code.encode('utf-8')).hexdigest()
+
+
+def _constructor_new_assignments(class_node) -> set:
+    """
+    Names of fields assigned a newly created object (`x = new T()` or
+    `this.x = new T()`) inside the class's constructors.
+    """
+    assigned = set()
+    constructors = class_node.constructors + [m for m in class_node.methods if m.name == class_node.name]
+    for constructor in constructors:
+        if not constructor.body:
+            continue
+        for _, assignment in constructor.filter(javalang.tree.Assignment):
+            if not isinstance(assignment.value, javalang.tree.Creator):
+                continue
+            target = assignment.expressionl
+            if isinstance(target, javalang.tree.This) and target.selectors:
+                target = target.selectors[-1]
+            if isinstance(target, javalang.tree.MemberReference):
+                assigned.add(target.member)
+    return assigned
+
+
 def detect_relationships(java_code: str) -> dict:
     """
     Detect association, aggregation, and composition relationships between classes.
@@ -410,373 +693,360 @@ def detect_relationships(java_code: str) -> dict:
         'composition': [...]
     }
     """
-    relationships = {
-        'association': [],
-        'aggregation': [],
-        'composition': []
+    # Dicts keyed by (from, to, via) act as insertion-ordered sets, so
+    # duplicates are dropped as they are discovered
+    relationships: dict[str, dict[tuple, dict]] = {
+        'association': {},
+        'aggregation': {},
+        'composition': {}
     }
     
     try:
-        wrapped_code, was_wrapped = wrap_code_if_needed(java_code)
-        tree = javalang.parse.parse(wrapped_code)
-        
         # Get all class names in the code
-        class_names = set()
-        class_nodes_map = {}
-        
-        for _, class_node in tree.filter(javalang.tree.ClassDeclaration):
-            class_names.add(class_node.name)
-            class_nodes_map[class_node.name] = class_node
+        class_nodes_map = parse_cached(java_code)['classes']
+        class_names = frozenset(class_nodes_map)
         
         # Analyze each class for relationships
         for class_name, class_node in class_nodes_map.items():
+            assigned_new: set | None = None  # Filled on first need by _constructor_new_assignments
+            # fields/methods are computed properties on javalang nodes; read them once
+            fields = class_node.fields
+            methods = class_node.methods
+
             # Check fields (association/aggregation/composition)
-            if class_node.fields:
-                for field in class_node.fields:
-                    field_type_name = None
-                    generic_arg_name = None
+            for field in fields:
+                field_type = field.type
+                field_type_name = _extract_type_name(field_type)
+                type_arguments = getattr(field_type, 'arguments', None)
+                generic_arg_name = None
+                
+                # Check for generic type arguments (e.g., List<Employee>)
+                if type_arguments:
+                    for arg in type_arguments:
+                        arg_name = getattr(arg, 'name', None)
+                        if arg_name is not None and arg_name in class_names:
+                            generic_arg_name = arg_name
+                            # This is a collection/array relationship (aggregation)
+                            via = f'field: {field_type_name or "Collection"}<{arg_name}>'
+                            relationships['aggregation'].setdefault((class_name, arg_name, via), {
+                                'from': class_name,
+                                'to': arg_name,
+                                'via': via,
+                                'details': f'Field: {[d.name for d in field.declarators]}'
+                            })
+                
+                # Check if base type is a class in our code (skip if we already handled it as generic)
+                if field_type_name and field_type_name in class_names and field_type_name != generic_arg_name:
+                    # Determine relationship type based on field characteristics
+                    # Check if it's a collection/array (aggregation)
+                    type_name = field_type_name.lower()
+                    is_collection = any(coll in type_name for coll in ['list', 'arraylist', 'set', 'hashset', 'collection', 'map', 'hashmap'])
                     
-                    if field.type:
-                        # Get base type name
-                        if hasattr(field.type, 'name'):
-                            field_type_name = field.type.name
+                    if is_collection:
+                        rel_type = 'aggregation'
+                    else:
+                        # Check modifiers to determine composition vs association
+                        # Composition: typically final, private, and initialized in constructor
+                        # Association: typically not final, or public/protected
+                        modifiers = field.modifiers
+                        is_final = modifiers and 'final' in modifiers
+                        is_private = modifiers and 'private' in modifiers
                         
-                        # Check for generic type arguments (e.g., List<Employee>)
-                        if hasattr(field.type, 'arguments') and field.type.arguments:
-                            for arg in field.type.arguments:
-                                if hasattr(arg, 'name') and arg.name in class_names:
-                                    generic_arg_name = arg.name
-                                    # This is a collection/array relationship (aggregation)
-                                    relationships['aggregation'].append({
-                                        'from': class_name,
-                                        'to': arg.name,
-                                        'via': f'field: {field_type_name or "Collection"}<{arg.name}>',
-                                        'details': f'Field: {[d.name for d in field.declarators]}'
-                                    })
-                    
-                    # Check if base type is a class in our code (skip if we already handled it as generic)
-                    if field_type_name and field_type_name in class_names and field_type_name != generic_arg_name:
-                        # Determine relationship type based on field characteristics
-                        # Check if it's a collection/array (aggregation)
-                        is_collection = False
-                        if hasattr(field.type, 'name'):
-                            type_name = field.type.name.lower()
-                            is_collection = any(coll in type_name for coll in ['list', 'arraylist', 'set', 'hashset', 'collection', 'map', 'hashmap'])
+                        # Check if field is initialized in constructor (composition indicator)
+                        if assigned_new is None:
+                            assigned_new = _constructor_new_assignments(class_node)
+                        initialized_in_constructor = any(d.name in assigned_new for d in field.declarators)
                         
-                        if is_collection:
-                            rel_type = 'aggregation'
+                        if is_final and is_private and initialized_in_constructor:
+                            rel_type = 'composition'
                         else:
-                            # Check modifiers to determine composition vs association
-                            # Composition: typically final, private, and initialized in constructor
-                            # Association: typically not final, or public/protected
-                            is_final = field.modifiers and 'final' in field.modifiers
-                            is_private = field.modifiers and 'private' in field.modifiers
-                            
-                            # Check if field is initialized in constructor (composition indicator)
-                            initialized_in_constructor = False
-                            if class_node.methods:
-                                for method in class_node.methods:
-                                    # Check if this is a constructor
-                                    is_constructor = (method.name == class_node.name) or (hasattr(method, 'name') and method.name == '<init>')
-                                    if is_constructor and method.body:
-                                        body_str = str(method.body)
-                                        for declarator in field.declarators:
-                                            if declarator.name in body_str and 'new ' in body_str:
-                                                initialized_in_constructor = True
-                                                break
-                            
-                            if is_final and is_private and initialized_in_constructor:
-                                rel_type = 'composition'
-                            else:
-                                rel_type = 'association'
-                        
-                        relationships[rel_type].append({
-                            'from': class_name,
-                            'to': field_type_name,
-                            'via': 'field',
-                            'details': f'Field: {[d.name for d in field.declarators]}'
-                        })
+                            rel_type = 'association'
+                    
+                    relationships[rel_type].setdefault((class_name, field_type_name, 'field'), {
+                        'from': class_name,
+                        'to': field_type_name,
+                        'via': 'field',
+                        'details': f'Field: {[d.name for d in field.declarators]}'
+                    })
             
             # Check method parameters (association)
-            if class_node.methods:
-                for method in class_node.methods:
-                    if method.parameters:
-                        for param in method.parameters:
-                            param_type_name = None
-                            if param.type:
-                                if hasattr(param.type, 'name'):
-                                    param_type_name = param.type.name
-                            
-                            if param_type_name and param_type_name in class_names:
-                                relationships['association'].append({
-                                    'from': class_name,
-                                    'to': param_type_name,
-                                    'via': 'method parameter',
-                                    'details': f'Method: {method.name}(...)'
-                                })
-            
-            # Check method return types (association)
-            if class_node.methods:
-                for method in class_node.methods:
-                    if method.return_type:
-                        return_type_name = None
-                        if hasattr(method.return_type, 'name'):
-                            return_type_name = method.return_type.name
-                        
-                        if return_type_name and return_type_name in class_names:
-                            relationships['association'].append({
+            for method in methods:
+                if method.parameters:
+                    for param in method.parameters:
+                        param_type_name = _extract_type_name(param.type)
+                        if param_type_name and param_type_name in class_names:
+                            relationships['association'].setdefault((class_name, param_type_name, 'method parameter'), {
                                 'from': class_name,
-                                'to': return_type_name,
-                                'via': 'method return type',
-                                'details': f'Method: {method.name}()'
+                                'to': param_type_name,
+                                'via': 'method parameter',
+                                'details': f'Method: {method.name}(...)'
                             })
+            
+            # Check method return types (association)
+            for method in methods:
+                return_type_name = _extract_type_name(method.return_type)
+                if return_type_name and return_type_name in class_names:
+                    relationships['association'].setdefault((class_name, return_type_name, 'method return type'), {
+                        'from': class_name,
+                        'to': return_type_name,
+                        'via': 'method return type',
+                        'details': f'Method: {method.name}()'
+                    })
         
-        # Remove duplicates
-        for rel_type in relationships:
-            seen = set()
-            unique_rels = []
-            for rel in relationships[rel_type]:
-                key = (rel['from'], rel['to'], rel['via'])
-                if key not in seen:
-                    seen.add(key)
-                    unique_rels.append(rel)
-            relationships[rel_type] = unique_rels
-        
-        return relationships
+        return {rel_type: list(rels.values()) for rel_type, rels in relationships.items()}
     
     except Exception as e:
         # Return empty relationships on error
         return {'association': [], 'aggregation': [], 'composition': []}
 
 
-# utils.py
-def build_ast_json(java_code: str) -> dict:
-    try:
-        # Wrap code in class if needed
-        wrapped_code, was_wrapped = wrap_code_if_needed(java_code)
-        tree = javalang.parse.parse(wrapped_code)
-        classes = []
-        
-        # Extract classes and methods first to generate comments
-        class_structure = extract_classes(java_code)
-        method_structure = extract_methods(java_code)
+# Opcodes of the flat class-tree program built by _class_tree_ops
+# (_OP_CLASS, class_name, display_name, field_rows, method_rows, has_subclasses):
+# opens the class and, when has_subclasses, its Subclasses section
+_OP_CLASS = 0
+_OP_END = 1  # (_OP_END,); closes the innermost open class or Subclasses section
+
+
+def _class_tree_ops(parsed: dict) -> list:
+    """
+    The build_ast_json class tree as a flat pre-order op list. Everything that
+    depends only on the source (tree shape, display names, field and method
+    rows) is resolved here once per cached parse; comments are added per request.
+    """
+    ops = parsed.get('tree_ops')
+    if ops is None:
+        class_nodes_map = parsed['classes']
+        inheritance_map = parsed['inheritance']
+        class_views = _class_views(parsed)
+        extends_info_map = parsed['extends_info']
+        rows_by_class: dict[str, tuple] = {}
+        # Field row builders keyed by (modifiers, type): "private static int " + name.
+        # Sources repeat a handful of combinations, so each prefix is formatted
+        # once and a row is a single concatenation.
+        row_formatters: dict[tuple[str, str], Callable[[str], str]] = {}
+        # A real inheritance chain is never deeper than the number of classes;
+        # anything deeper is a cycle through duplicate class names
+        max_depth = len(class_nodes_map)
+
+        ops = []
+        # A None entry emits the _OP_END of the class or section opened before its children
+        stack: list[tuple[str | None, int]] = [(root_class, 0) for root_class in reversed(parsed['roots'])]
+        while stack:
+            class_name, depth = stack.pop()
+            if class_name is None:
+                ops.append((_OP_END,))
+                continue
+            if class_name not in class_nodes_map or depth > max_depth:
+                continue
+
+            view = class_views[class_name]
+            rows = rows_by_class.get(class_name)
+            if rows is None:
+                field_rows = []
+                for modifiers, field_type, field_name in zip(view.field_mods, view.field_types, view.field_names):
+                    formatter = row_formatters.get((modifiers, field_type))
+                    if formatter is None:
+                        formatter = row_formatters[modifiers, field_type] = f"{modifiers} {field_type} ".__add__
+                    field_rows.append(formatter(field_name))
+                rows = rows_by_class[class_name] = (tuple(field_rows), tuple(zip(view.method_names, view.method_sigs)))
+            # Subclasses are only listed when at least one of them gets rendered
+            has_subclasses = class_name in inheritance_map and depth < max_depth
+            ops.append((_OP_CLASS, class_name, class_name + extends_info_map[class_name], rows[0], rows[1], has_subclasses))
+            stack.append((None, depth))
+            if has_subclasses:
+                stack.append((None, depth))
+                stack.extend((child_class_name, depth + 1) for child_class_name in reversed(inheritance_map[class_name]))
+        parsed['tree_ops'] = ops
+    return ops
 
-        hf_client = current_app.hf_client
 
+def _generate_ast_comments(java_code: str) -> dict:
+    """
+    Comments for every class and method of java_code from the HF Space, as
+    {class_name: {"self": class comment, "methods": {method_name: comment}}}.
+    Either key is only filled in when a comment was generated for it.
+    """
+    # Extract classes and methods first to generate comments
+    class_structure = extract_classes(java_code)
+    method_structure = extract_methods(java_code)
+
+    hf_client = current_app.hf_client  # type: ignore[attr-defined]
+
+    
+    # Generate comments using batch processing for maximum speed
+    comments: dict[str, dict] = {}
+    
+    if hf_client:
+        # Prepare all inputs for batch processing
+        all_inputs = []
+        input_mapping: list[tuple[str, str, str | None]] = []  # Track which input corresponds to which class/method
         
-        # Generate comments using batch processing for maximum speed
-        class_comments = {}
-        method_comments = {}
+        # Add classes
+        for class_name, class_code in class_structure.items():
+            if isinstance(class_code, str):
+                processed_class = preprocess_code(class_code)
+                all_inputs.append(processed_class)
+                input_mapping.append(('class', class_name, None))
         
-        if hf_client:
-            # Prepare all inputs for batch processing
-            all_inputs = []
-            input_mapping = []  # Track which input corresponds to which class/method
-            
-            # Add classes
-            for class_name, class_code in class_structure.items():
-                if isinstance(class_code, str):
-                    processed_class = preprocess_code(class_code)
-                    all_inputs.append(processed_class)
-                    input_mapping.append(('class', class_name, None))
-            
-            # Add methods
-            for class_name, methods in method_structure.items():
-                if isinstance(methods, list):
-                    for method in methods:
-                        processed_method = preprocess_code(method['code'])
-                        all_inputs.append(processed_method)
-                        input_mapping.append(('method', class_name, method['name']))
-            
-            # Process in batches (model can handle multiple inputs at once)
-            if all_inputs:
-                try:
-                    # Process all inputs in one batch call (much faster than individual calls)
-                    batch_results = []
-                    if hf_client:
-                        for snippet in all_inputs:
-                            try:
-                                result = hf_client.predict(
-                                    snippet,
-                                    api_name="/generate_comment"
-                                )
-                                batch_results.append(clean_comment(result))
-                            except Exception as e:
-                                print(f"❌ HF API error for snippet: {e}")
-                                batch_results.append("No comment available")
+        # Add methods
+        for class_name, methods in method_structure.items():
+            if isinstance(methods, list):
+                for method in methods:
+                    processed_method = preprocess_code(method['code'])
+                    all_inputs.append(processed_method)
+                    input_mapping.append(('method', class_name, method['name']))
+        
+        # Process in batches (model can handle multiple inputs at once)
+        if all_inputs:
+            try:
+                def generate_comment(snippet):
+                    try:
+                        result = hf_client.predict(
+                            snippet,
+                            api_name="/generate_comment"
+                        )
+                        return clean_comment(result)
+                    except Exception as e:
+                        print(f"❌ HF API error for snippet: {e}")
+                        return "No comment available"
 
-                    
-                    # Map results back to classes/methods
-                    for idx, (input_type, class_name, method_name) in enumerate(input_mapping):
-                        if idx < len(batch_results):
-                            result = batch_results[idx]
-                            comment = clean_comment(result)  # result is already a string
-                            
-                            if input_type == 'class':
-                                class_comments[class_name] = comment
-                            else:  # method
-                                method_comments[(class_name, method_name)] = comment
-                except Exception as e:
-                    # Fallback to sequential if batch fails
-                    print(f"Batch processing failed, falling back to sequential: {e}")
-                    for class_name, class_code in class_structure.items():
-                        if isinstance(class_code, str):
+                # Remote calls wait on the network (GIL released), so overlap them.
+                # Each distinct snippet is sent once, longest first, so the slowest
+                # requests start early instead of trailing behind a drained queue.
+                unique_inputs = sorted(set(all_inputs), key=len, reverse=True)
+                with ThreadPoolExecutor(max_workers=min(8, len(unique_inputs))) as executor:
+                    comments_by_input = dict(zip(unique_inputs, executor.map(generate_comment, unique_inputs)))
+                batch_results = [comments_by_input[snippet] for snippet in all_inputs]
+                
+                # Map results back to classes/methods
+                for idx, (input_type, class_name, method_name) in enumerate(input_mapping):
+                    if idx < len(batch_results):
+                        result = batch_results[idx]
+                        comment = clean_comment(result)  # result is already a string
+                        
+                        class_entry = comments.setdefault(class_name, {"methods": {}})
+                        if input_type == 'class':
+                            class_entry["self"] = comment
+                        else:  # method
+                            class_entry["methods"][method_name] = comment
+            except Exception as e:
+                # Fallback to sequential if batch fails
+                print(f"Batch processing failed, falling back to sequential: {e}")
+                for class_name, class_code in class_structure.items():
+                    if isinstance(class_code, str):
+                        try:
+                            processed_class = preprocess_code(class_code)
+                            if hf_client:
+                                try:
+                                    result = hf_client.predict(
+                                        processed_class,  # positional argument
+                                        api_name="/generate_comment"       # first function in your HF Space
+                                    )
+                                    comment = clean_comment(result)  # result is a string
+                                except Exception as e:
+                                    print(f"❌ Error generating comment: {e}")
+                                    comment = "No comment available"
+                            comments.setdefault(class_name, {"methods": {}})["self"] = comment
+                        except Exception as e2:
+                            print(f"Error generating AST comment for class {class_name}: {e2}")
+                
+                for class_name, methods in method_structure.items():
+                    if isinstance(methods, list):
+                        for method in methods:
                             try:
-                                processed_class = preprocess_code(class_code)
+                                processed_method = preprocess_code(method['code'])
                                 if hf_client:
                                     try:
                                         result = hf_client.predict(
-                                            processed_class,  # positional argument
+                                            processed_method,  # positional argument
                                             api_name="/generate_comment"       # first function in your HF Space
                                         )
                                         comment = clean_comment(result)  # result is a string
                                     except Exception as e:
                                         print(f"❌ Error generating comment: {e}")
                                         comment = "No comment available"
-                                class_comments[class_name] = comment
+                                comments.setdefault(class_name, {"methods": {}})["methods"][method['name']] = comment
                             except Exception as e2:
-                                print(f"Error generating AST comment for class {class_name}: {e2}")
-                    
-                    for class_name, methods in method_structure.items():
-                        if isinstance(methods, list):
-                            for method in methods:
-                                try:
-                                    processed_method = preprocess_code(method['code'])
-                                    if hf_client:
-                                        try:
-                                            result = hf_client.predict(
-                                                processed_method,  # positional argument
-                                                api_name="/generate_comment"       # first function in your HF Space
-                                            )
-                                            comment = clean_comment(result)  # result is a string
-                                        except Exception as e:
-                                            print(f"❌ Error generating comment: {e}")
-                                            comment = "No comment available"
-                                    method_comments[(class_name, method['name'])] = comment
-                                except Exception as e2:
-                                    print(f"Error generating AST comment for method {class_name}.{method['name']}: {e2}")
-
-        # First pass: collect all classes and their inheritance relationships
-        class_nodes_map = {}
-        inheritance_map = {}  # Maps parent class name -> list of child class names
-        child_to_parent = {}  # Maps child class name -> parent class name
-        root_classes = []  # Classes that don't extend anything (or extend external classes)
-        
-        for _, class_node in tree.filter(javalang.tree.ClassDeclaration):
-            class_name = class_node.name
-            class_nodes_map[class_name] = class_node
-            
-            # Check if class extends another class
-            if hasattr(class_node, 'extends') and class_node.extends:
-                # Get the superclass name
-                parent_name = None
-                if hasattr(class_node.extends, 'name'):
-                    parent_name = class_node.extends.name
-                elif isinstance(class_node.extends, list) and len(class_node.extends) > 0:
-                    parent_name = class_node.extends[0].name if hasattr(class_node.extends[0], 'name') else str(class_node.extends[0])
-                else:
-                    parent_name = str(class_node.extends)
-                
-                # Check if parent class exists in our code
-                if parent_name and parent_name in class_nodes_map:
-                    # Parent is in our code, add to inheritance map
-                    if parent_name not in inheritance_map:
-                        inheritance_map[parent_name] = []
-                    inheritance_map[parent_name].append(class_name)
-                    child_to_parent[class_name] = parent_name
-                else:
-                    # Parent is external, treat as root class
-                    root_classes.append(class_name)
-            else:
-                # No extends, this is a root class
-                root_classes.append(class_name)
-        
-        # Helper function to build class data recursively
-        def build_class_data(class_name):
-            if class_name not in class_nodes_map:
-                return None
-            
-            class_node = class_nodes_map[class_name]
-            
-            # Show inheritance info in name
-            extends_info = ""
-            if hasattr(class_node, 'extends') and class_node.extends:
-                if hasattr(class_node.extends, 'name'):
-                    parent_name = class_node.extends.name
-                elif isinstance(class_node.extends, list) and len(class_node.extends) > 0:
-                    parent_name = class_node.extends[0].name if hasattr(class_node.extends[0], 'name') else str(class_node.extends[0])
-                else:
-                    parent_name = str(class_node.extends)
-                extends_info = f" extends {parent_name}"
-            
-            class_data = {
-                "name": f"{class_name}{extends_info}",
-                "type": "class",
-                "comment": class_comments.get(class_name, "No comment available"),
-                "children": []
-            }
-
-            # Fields
-            if class_node.fields:
-                fields_node = {
-                    "name": "Fields",
-                    "type": "fields",
-                    "children": []
-                }
-                for field in class_node.fields:
-                    modifiers = " ".join(field.modifiers) if field.modifiers else ""
-                    field_type = field.type.name if field.type else "Unknown"
-                    for declarator in field.declarators:
-                        field_data = {
-                            "name": f"{modifiers} {field_type} {declarator.name}",
-                            "type": "field"
-                        }
-                        fields_node["children"].append(field_data)
-                class_data["children"].append(fields_node)
-
-            # Methods
-            if class_node.methods:
-                methods_node = {
-                    "name": "Methods",
-                    "type": "methods",
-                    "children": []
-                }
-                for method in class_node.methods:
-                    modifiers = " ".join(method.modifiers) if method.modifiers else ""
-                    return_type = method.return_type.name if method.return_type else "void"
-                    params = ", ".join([f"{p.type.name} {p.name}" for p in method.parameters]) if method.parameters else ""
-                    method_data = {
-                        "name": f"{modifiers} {return_type} {method.name}({params})",
-                        "type": "method",
-                        "comment": method_comments.get((class_name, method.name), "No comment available")
-                    }
-                    methods_node["children"].append(method_data)
-                class_data["children"].append(methods_node)
-            
-            # Add child classes (subclasses) as children
-            if class_name in inheritance_map:
-                subclasses_node = {
-                    "name": "Subclasses",
-                    "type": "subclasses",
-                    "children": []
-                }
-                for child_class_name in inheritance_map[class_name]:
-                    child_class_data = build_class_data(child_class_name)
-                    if child_class_data:
-                        subclasses_node["children"].append(child_class_data)
-                if subclasses_node["children"]:
-                    class_data["children"].append(subclasses_node)
-            
-            return class_data
-        
-        # Build AST starting from root classes
-        classes = []
-        for root_class in root_classes:
-            class_data = build_class_data(root_class)
-            if class_data:
-                classes.append(class_data)
-        
-        return {"name": "Root", "type": "root", "children": classes}
-    
-    except javalang.parser.JavaSyntaxError as e:
-        return {"error": f"Java Syntax Error: {e.description}"}
\ No newline at end of file
+                                print(f"Error generating AST comment for method {class_name}.{method['name']}: {e2}")
+
+    return comments
+
+
+_NO_COMMENTS: dict[str, Any] = {"methods": {}}  # Comment entry for a class nothing was generated for
+
+
+# utils.py
+def build_ast_json(java_code: str) -> dict:
+    """The AST class tree as a dict; decoded from build_ast_json_text, which does the work."""
+    return json.loads(build_ast_json_text(java_code))
+
+
+def _class_tree_json(ops: list, comments: dict) -> str:
+    """
+    Compact JSON text of the AST class list, written straight from the op list
+    instead of building nested dicts and encoding them afterwards. Classes are
+    {"name", "type": "class", "comment", "children"}, with Fields, Methods and
+    Subclasses group nodes as children.
+    """
+    dumps = json.dumps
+    no_comment = dumps("No comment available")
+    parts: list[str] = []
+    append = parts.append
+    is_empty = [True]  # One flag per open children list, innermost last
+    member_json: dict[str, str] = {}  # Class name -> its Fields/Methods JSON
+    for op in ops:
+        if op[0] == _OP_END:
+            append(']}')
+            is_empty.pop()
+            continue
+        if not is_empty[-1]:
+            append(',')
+        is_empty[-1] = False
+
+        _, class_name, display_name, field_rows, method_rows, has_subclasses = op  # _OP_CLASS
+        class_entry = comments.get(class_name, _NO_COMMENTS)
+        comment = class_entry.get("self")
+        append('{"name":%s,"type":"class","comment":%s,"children":[' % (
+            dumps(display_name), no_comment if comment is None else dumps(comment)
+        ))
+        members = member_json.get(class_name)
+        if members is None:
+            sections = []
+            if field_rows:
+                sections.append('{"name":"Fields","type":"fields","children":[%s]}' % ','.join([
+                    '{"name":%s,"type":"field"}' % dumps(row) for row in field_rows
+                ]))
+            if method_rows:
+                rows = []
+                method_comments = class_entry["methods"]
+                for method_name, signature in method_rows:
+                    comment = method_comments.get(method_name)
+                    rows.append('{"name":%s,"type":"method","comment":%s}' % (
+                        dumps(signature), no_comment if comment is None else dumps(comment)
+                    ))
+                sections.append('{"name":"Methods","type":"methods","children":[%s]}' % ','.join(rows))
+            members = member_json[class_name] = ','.join(sections)
+        append(members)
+        if has_subclasses:
+            append('%s{"name":"Subclasses","type":"subclasses","children":[' % (',' if members else ''))
+            is_empty.append(False)  # The class's list holds the Subclasses node
+            is_empty.append(True)
+        else:
+            is_empty.append(not members)
+    return '[%s]' % ''.join(parts)
+
+
+def build_ast_json_text(java_code: str, **extra) -> str:
+    """
+    build_ast_json serialised to JSON text, with extra added as top-level keys.
+    Used by the /ast-json route, which only needs the encoded response.
+    """
+    parsed, error = _parse(java_code)
+    if parsed is None:
+        return json.dumps({"error": f"Java Syntax Error: {error.description}", **extra}, separators=(',', ':'))
+
+    comments = _generate_ast_comments(java_code)
+    children = _class_tree_json(_class_tree_ops(parsed), comments)
+    return '{"name":"Root","type":"root","children":%s%s}' % (
+        children, ''.join([',%s:%s' % (json.dumps(key), json.dumps(value, separators=(',', ':'))) for key, value in extra.items()])
+    )